@@ -1,4 +1,7 @@
+import numpy as np
 import numpy.testing as npt
+import pandas as pd
+import pytest
 
 from message_ix import Scenario, make_df
 
@@ -17,9 +20,22 @@ def model_setup(scen, years, simple_tecs=True):
     scen.add_set("emission", "CO2")
     scen.add_cat("emission", "ghg", "CO2")
 
-    for y in years:
-        scen.add_par("interestrate", y, 0.05, "-")
-        scen.add_par("demand", ["node", "comm", "level", y, "year"], 1, "GWa")
+    scen.add_par(
+        "interestrate", make_df("interestrate", year=years, value=0.05, unit="-")
+    )
+    scen.add_par(
+        "demand",
+        make_df(
+            "demand",
+            node="node",
+            commodity="comm",
+            level="level",
+            year=years,
+            time="year",
+            value=1,
+            unit="GWa",
+        ),
+    )
 
     if simple_tecs:
         add_two_tecs(scen, years)
@@ -29,25 +45,34 @@ def model_setup(scen, years, simple_tecs=True):
 
 def add_two_tecs(scen, years):
     """add two technologies to the scenario"""
-    scen.add_set("technology", ["dirty_tec", "clean_tec"])
+    tecs = ["dirty_tec", "clean_tec"]
+    scen.add_set("technology", tecs)
 
     common = dict(node_loc="node", year_vtg=years, year_act=years, value=1, mode="mode")
 
-    # the dirty technology is free (no costs) but has emissions
+    # both technologies have the same output; add all rows at once
     scen.add_par(
         "output",
-        make_df(
-            "output",
-            node_dest="node",
-            technology="dirty_tec",
-            commodity="comm",
-            level="level",
-            time="year",
-            time_dest="year",
-            unit="GWa",
-            **common,
+        pd.concat(
+            [
+                make_df(
+                    "output",
+                    node_dest="node",
+                    technology=t,
+                    commodity="comm",
+                    level="level",
+                    time="year",
+                    time_dest="year",
+                    unit="GWa",
+                    **common,
+                )
+                for t in tecs
+            ],
+            ignore_index=True,
         ),
     )
+
+    # the dirty technology is free (no costs) but has emissions
     scen.add_par(
         "emission_factor",
         make_df(
@@ -60,54 +85,103 @@ def add_two_tecs(scen, years):
     )
 
     # the clean technology has variable costs but no emissions
+    scen.add_par(
+        "var_cost",
+        make_df(
+            "var_cost",
+            time="year",
+            unit="USD/GWa",
+            technology="clean_tec",
+            **common,
+        ),
+    )
+
+
+def add_many_tecs(scen, years, n=50):
+    """add a range of dirty-to-clean technologies to the scenario"""
+    tecs = ["tec{}".format(i) for i in range(n + 1)]
+    scen.add_set("technology", tecs)
+
+    # one row for each combination of technology and year
+    idx = pd.MultiIndex.from_product([tecs, years], names=["technology", "year"])
+    common = dict(
+        node_loc="node",
+        technology=idx.get_level_values("technology"),
+        year_vtg=idx.get_level_values("year"),
+        year_act=idx.get_level_values("year"),
+        mode="mode",
+        time="year",
+    )
+
+    i = np.arange(n + 1)
+    # variable costs grow quadratically over technologies
+    # to get rid of the curse of linearity
+    cost = np.outer((10 * i / n) ** 2, 1.045 ** (np.array(years) - years[0]))
+    emi = (1 - i / n).repeat(len(years))
+
     scen.add_par(
         "output",
         make_df(
             "output",
             node_dest="node",
-            technology="clean_tec",
             commodity="comm",
             level="level",
-            time="year",
             time_dest="year",
+            value=1,
             unit="GWa",
             **common,
         ),
     )
     scen.add_par(
-        "var_cost",
-        make_df(
-            "var_cost",
-            time="year",
-            unit="USD/GWa",
-            technology="clean_tec",
-            **common,
-        ),
+        "var_cost", make_df("var_cost", value=cost.ravel(), unit="USD/GWa", **common)
+    )
+    scen.add_par(
+        "emission_factor",
+        make_df("emission_factor", emission="CO2", value=emi, unit="tCO2", **common),
     )
 
 
-def add_many_tecs(scen, years, n=50):
-    """add a range of dirty-to-clean technologies to the scenario"""
-    output_specs = ["node", "comm", "level", "year", "year"]
+@pytest.fixture(scope="module")
+def base_scen(test_mp):
+    """Function that returns an unsolved clone of a scenario from :func:`model_setup`.
 
-    for i in range(n + 1):
-        t = "tec{}".format(i)
-        scen.add_set("technology", t)
-        for y in years:
-            tec_specs = ["node", t, y, y, "mode"]
-            # variable costs grow quadratically over technologies
-            # to get rid of the curse of linearity
-            c = (10 * i / n) ** 2 * (1.045) ** (y - years[0])
-            e = 1 - i / n
-            scen.add_par("output", tec_specs + output_specs, 1, "GWa")
-            scen.add_par("var_cost", tec_specs + ["year"], c, "USD/GWa")
-            scen.add_par("emission_factor", tec_specs + ["CO2"], e, "tCO2")
-
-
-def test_no_constraint(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
-    model_setup(scen, [2020, 2030])
-    scen.commit("initialize test scenario")
+    The base scenario for each distinct combination of `years` and `simple_tecs` is
+    created only once per module.
+    """
+    cache = {}
+
+    def _clone(scenario, years, simple_tecs=True):
+        key = (tuple(years), simple_tecs)
+        if key not in cache:
+            name = f"base {len(cache)}"
+            base = Scenario(test_mp, MODEL, scenario=name, version="new")
+            model_setup(base, years, simple_tecs)
+            base.commit("initialize base scenario")
+            cache[key] = base
+
+        return cache[key].clone(scenario=scenario, keep_solution=False)
+
+    yield _clone
+
+
+@pytest.fixture(scope="module")
+def cumulative_scen(base_scen):
+    """Solved scenario with many technologies and a cumulative emissions bound."""
+    years = [2020, 2025, 2030, 2040, 2050]
+
+    scen = base_scen("cum_many_tecs", years, simple_tecs=False)
+    with scen.transact("initialize test scenario"):
+        scen.add_cat("year", "cumulative", years)
+        scen.add_par(
+            "bound_emission", ["World", "ghg", "all", "cumulative"], 0.5, "tCO2"
+        )
+    scen.solve(quiet=True)
+
+    yield scen
+
+
+def test_no_constraint(base_scen, request):
+    scen = base_scen(request.node.name, [2020, 2030])
     scen.solve(quiet=True)
 
     # without emissions constraint, the zero-cost technology satisfies demand
@@ -116,14 +190,13 @@ def test_no_constraint(test_mp, request):
     assert scen.var("PRICE_EMISSION").empty
 
 
-def test_cumulative_equidistant(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
+def test_cumulative_equidistant(base_scen, request):
     years = [2020, 2030, 2040]
+    scen = base_scen(request.node.name, years)
 
-    model_setup(scen, years)
-    scen.add_cat("year", "cumulative", years)
-    scen.add_par("bound_emission", ["World", "ghg", "all", "cumulative"], 0, "tCO2")
-    scen.commit("initialize test scenario")
+    with scen.transact("initialize test scenario"):
+        scen.add_cat("year", "cumulative", years)
+        scen.add_par("bound_emission", ["World", "ghg", "all", "cumulative"], 0, "tCO2")
     scen.solve(quiet=True)
 
     # with emissions constraint, the technology with costs satisfies demand
@@ -131,18 +204,28 @@ def test_cumulative_equidistant(test_mp, request):
     # under a cumulative constraint, the price must increase with the discount
     # rate starting from the marginal relaxation in the first year
     obs = scen.var("PRICE_EMISSION")["lvl"].values
-    npt.assert_allclose(obs, [1.05 ** (y - years[0]) for y in years])
+    npt.assert_allclose(obs, 1.05 ** (np.array(years) - years[0]))
 
 
-def test_per_period_equidistant(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
+def test_per_period_equidistant(base_scen, request):
     years = [2020, 2030, 2040]
+    scen = base_scen(request.node.name, years)
 
-    model_setup(scen, years)
-    for y in years:
-        scen.add_cat("year", y, y)
-        scen.add_par("bound_emission", ["World", "ghg", "all", y], 0, "tCO2")
-    scen.commit("initialize test scenario")
+    with scen.transact("initialize test scenario"):
+        for y in years:
+            scen.add_cat("year", y, y)
+        scen.add_par(
+            "bound_emission",
+            make_df(
+                "bound_emission",
+                node="World",
+                type_emission="ghg",
+                type_tec="all",
+                type_year=years,
+                value=0,
+                unit="tCO2",
+            ),
+        )
     scen.solve(quiet=True)
 
     # with emissions constraint, the technology with costs satisfies demand
@@ -152,14 +235,13 @@ def test_per_period_equidistant(test_mp, request):
     npt.assert_allclose(scen.var("PRICE_EMISSION")["lvl"], [1] * 3)
 
 
-def test_cumulative_variable_periodlength(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
+def test_cumulative_variable_periodlength(base_scen, request):
     years = [2020, 2025, 2030, 2040]
+    scen = base_scen(request.node.name, years)
 
-    model_setup(scen, years)
-    scen.add_cat("year", "cumulative", years)
-    scen.add_par("bound_emission", ["World", "ghg", "all", "cumulative"], 0, "tCO2")
-    scen.commit("initialize test scenario")
+    with scen.transact("initialize test scenario"):
+        scen.add_cat("year", "cumulative", years)
+        scen.add_par("bound_emission", ["World", "ghg", "all", "cumulative"], 0, "tCO2")
     scen.solve(quiet=True)
 
     # with an emissions constraint, the technology with costs satisfies demand
@@ -167,18 +249,28 @@ def test_cumulative_variable_periodlength(test_mp, request):
     # under a cumulative constraint, the price must increase with the discount
     # rate starting from the marginal relaxation in the first year
     obs = scen.var("PRICE_EMISSION")["lvl"].values
-    npt.assert_allclose(obs, [1.05 ** (y - years[0]) for y in years])
+    npt.assert_allclose(obs, 1.05 ** (np.array(years) - years[0]))
 
 
-def test_per_period_variable_periodlength(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
+def test_per_period_variable_periodlength(base_scen, request):
     years = [2020, 2025, 2030, 2040]
+    scen = base_scen(request.node.name, years)
 
-    model_setup(scen, years)
-    for y in years:
-        scen.add_cat("year", y, y)
-        scen.add_par("bound_emission", ["World", "ghg", "all", y], 0, "tCO2")
-    scen.commit("initialize test scenario")
+    with scen.transact("initialize test scenario"):
+        for y in years:
+            scen.add_cat("year", y, y)
+        scen.add_par(
+            "bound_emission",
+            make_df(
+                "bound_emission",
+                node="World",
+                type_emission="ghg",
+                type_tec="all",
+                type_year=years,
+                value=0,
+                unit="tCO2",
+            ),
+        )
     scen.solve(quiet=True)
 
     # with an emissions constraint, the technology with costs satisfies demand
@@ -188,16 +280,14 @@ def test_per_period_variable_periodlength(test_mp, request):
     npt.assert_allclose(scen.var("PRICE_EMISSION")["lvl"].values, [1] * 4)
 
 
-def test_custom_type_variable_periodlength(test_mp, request):
-    scen = Scenario(test_mp, MODEL, scenario=request.node.name, version="new")
+def test_custom_type_variable_periodlength(base_scen, request):
     years = [2020, 2025, 2030, 2040, 2050]
     custom = [2025, 2030, 2040]
+    scen = base_scen(request.node.name, years)
 
-    model_setup(scen, years)
-    scen.add_cat("year", "custom", custom)
-    scen.add_par("bound_emission", ["World", "ghg", "all", "custom"], 0, "tCO2")
-
-    scen.commit("initialize test scenario")
+    with scen.transact("initialize test scenario"):
+        scen.add_cat("year", "custom", custom)
+        scen.add_par("bound_emission", ["World", "ghg", "all", "custom"], 0, "tCO2")
     scen.solve(quiet=True)
 
     # with an emissions constraint, the technology with costs satisfies demand
@@ -205,43 +295,30 @@ def test_custom_type_variable_periodlength(test_mp, request):
     # under a cumulative constraint, the price must increase with the discount
     # rate starting from the marginal relaxation in the first year
     obs = scen.var("PRICE_EMISSION")["lvl"].values
-    npt.assert_allclose(obs, [1.05 ** (y - custom[0]) for y in custom])
+    npt.assert_allclose(obs, 1.05 ** (np.array(custom) - custom[0]))
 
 
-def test_price_duality(test_mp, request):
+def test_price_duality(base_scen, request, cumulative_scen):
     years = [2020, 2025, 2030, 2040, 2050]
-    for c in [0.25, 0.5, 0.75]:
-        # set up a scenario for cumulative constraints
-        scen = Scenario(
-            test_mp, MODEL, scenario=request.node.name + "_cum_many_tecs", version="new"
-        )
-        model_setup(scen, years, simple_tecs=False)
-        scen.add_cat("year", "cumulative", years)
-        scen.add_par(
-            "bound_emission", ["World", "ghg", "all", "cumulative"], 0.5, "tCO2"
-        )
-        scen.commit("initialize test scenario")
-        scen.solve(quiet=True)
+    scen = cumulative_scen
 
-        # set up a new scenario with emissions taxes
-        tax_scen = Scenario(
-            test_mp, MODEL, scenario=request.node.name + "_tax_many_tecs", version="new"
-        )
-        model_setup(tax_scen, years, simple_tecs=False)
+    # set up a new scenario with emissions taxes
+    tax_scen = base_scen(request.node.name + "_tax_many_tecs", years, simple_tecs=False)
+    with tax_scen.transact("initialize test scenario for taxes"):
         for y in years:
             tax_scen.add_cat("year", y, y)
 
         # use emission prices from cumulative-constraint scenario as taxes
-        taxes = scen.var("PRICE_EMISSION").rename(
-            columns={"year": "type_year", "lvl": "value"}
+        taxes = (
+            scen.var("PRICE_EMISSION")
+            .rename(columns={"year": "type_year", "lvl": "value"})
+            .assign(unit="USD/tCO2")
         )
-        taxes["unit"] = "USD/tCO2"
         tax_scen.add_par("tax_emission", taxes)
-        tax_scen.commit("initialize test scenario for taxes")
-        tax_scen.solve(quiet=True)
-
-        # check that emissions are close between cumulative and tax scenario
-        filters = {"node": "World"}
-        emiss = scen.var("EMISS", filters).set_index("year").lvl
-        emiss_tax = tax_scen.var("EMISS", filters).set_index("year").lvl
-        npt.assert_allclose(emiss, emiss_tax, rtol=0.20)
+    tax_scen.solve(quiet=True)
+
+    # check that emissions are close between cumulative and tax scenario
+    filters = {"node": "World"}
+    emiss = scen.var("EMISS", filters).set_index("year").lvl
+    emiss_tax = tax_scen.var("EMISS", filters).set_index("year").lvl
+    npt.assert_allclose(emiss, emiss_tax, rtol=0.20)